@@ -1,30 +1,99 @@
 from flask import Flask, jsonify, render_template
 import cv2
 from ultralytics import YOLO
+import torch
 import threading
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
-from collections import deque, OrderedDict
+from collections import Counter, deque, OrderedDict
+from operator import attrgetter
 import os
-import uuid
 import numpy as np
 from scipy.spatial import distance as dist
+from scipy.optimize import linear_sum_assignment
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 app = Flask(__name__)
 
+def ojson(payload):
+    """JSON response encoded with orjson (jsonify without it), for the endpoints the dashboard polls"""
+    if not ORJSON_AVAILABLE:
+        return jsonify(payload)
+    return app.response_class(
+        orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS),
+        mimetype='application/json'
+    )
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tracker match rule, shared by the Numba kernel and the NumPy fallback
+MIN_MATCH_IOU = 0.05     # Pairs overlapping less than this are never matched
+DISTANCE_WEIGHT = 0.6    # Weight of the normalized centroid distance in the cost
+OVERLAP_WEIGHT = 0.4     # Weight of (1 - IoU) in the cost
+MAX_MATCH_COST = 1.0     # Assignments at or above this cost are rejected
+NO_MATCH_COST = 999.0    # Cost of a pair that fails the type, distance or IoU gate
+
+def _build_cost(obj_boxes, obj_centroids, obj_type_ids, det_boxes, det_centroids, det_type_ids, max_distance):
+    """Fused tracker cost: IoU, distance and type gate for every (object, detection) pair in one pass"""
+    n = obj_boxes.shape[0]
+    m = det_boxes.shape[0]
+    cost = np.empty((n, m), dtype=np.float64)
+    
+    for i in range(n):
+        ax1, ay1, ax2, ay2 = obj_boxes[i, 0], obj_boxes[i, 1], obj_boxes[i, 2], obj_boxes[i, 3]
+        area_a = (ax2 - ax1) * (ay2 - ay1)
+        
+        for j in range(m):
+            if obj_type_ids[i] != det_type_ids[j]:
+                cost[i, j] = NO_MATCH_COST
+                continue
+            
+            dx = obj_centroids[i, 0] - det_centroids[j, 0]
+            dy = obj_centroids[i, 1] - det_centroids[j, 1]
+            distance = np.sqrt(dx * dx + dy * dy)
+            
+            bx1, by1, bx2, by2 = det_boxes[j, 0], det_boxes[j, 1], det_boxes[j, 2], det_boxes[j, 3]
+            w = min(ax2, bx2) - max(ax1, bx1)
+            h = min(ay2, by2) - max(ay1, by1)
+            intersection = w * h if w > 0 and h > 0 else 0.0
+            area_b = (bx2 - bx1) * (by2 - by1)
+            overlap = intersection / (area_a + area_b - intersection + 1e-9)
+            
+            if distance <= max_distance and overlap >= MIN_MATCH_IOU:
+                cost[i, j] = (distance / max_distance) * DISTANCE_WEIGHT + (1 - overlap) * OVERLAP_WEIGHT
+            else:
+                cost[i, j] = NO_MATCH_COST
+    
+    return cost
+
+if NUMBA_AVAILABLE:
+    _build_cost = njit(cache=True, fastmath=True)(_build_cost)
+
 class DetectedObject:
-    def __init__(self, vehicle_type, confidence_score, bbox, centroid):
-        self.id = str(uuid.uuid4())[:8]  # Short unique ID
+    VEHICLE_TYPE_TO_INT = {'car': 0, 'motorcycle': 1}
+    
+    def __init__(self, vehicle_type, confidence_score, bbox, centroid, obj_id):
+        self.id = obj_id
         self.vehicle_type = vehicle_type
+        self.type_id = self.VEHICLE_TYPE_TO_INT[vehicle_type]
         self.confidence_score = round(confidence_score * 100, 1)  # Convert to percentage
-        self.detected_at = datetime.now().strftime("%H:%M:%S")
         self.first_seen = datetime.now()
-        self.last_seen = datetime.now()
+        self.detected_at = self.first_seen.strftime("%H:%M:%S")
+        self.last_seen_mono = time.monotonic()
         self.bbox = bbox
         self.centroid = centroid
         self.status = "Active"
@@ -32,7 +101,7 @@ class DetectedObject:
         
     def update_detection(self, confidence_score, bbox, centroid):
         """Update existing object with new detection data"""
-        self.last_seen = datetime.now()
+        self.last_seen_mono = time.monotonic()
         self.bbox = bbox
         self.centroid = centroid
         self.update_count += 1
@@ -45,9 +114,10 @@ class DetectedObject:
         
         self.status = "Active"
     
-    def to_dict(self):
+    def to_dict(self, now, now_mono):
+        """Serialize for the API; now / now_mono are taken once per request by the caller"""
         # Mark as expired if not seen for 10 seconds
-        if datetime.now() - self.last_seen > timedelta(seconds=10):
+        if now_mono - self.last_seen_mono > 10.0:
             self.status = "Expired"
         
         return {
@@ -56,66 +126,201 @@ class DetectedObject:
             'confidence_score': self.confidence_score,
             'detected_at': self.detected_at,
             'status': self.status,
-            'bbox': self.bbox,
+            'bbox': {'x1': float(self.bbox[0]), 'y1': float(self.bbox[1]),
+                     'x2': float(self.bbox[2]), 'y2': float(self.bbox[3])},
             'update_count': self.update_count,
-            'duration': str(datetime.now() - self.first_seen).split('.')[0]  # Remove microseconds
+            'duration': str(now - self.first_seen).split('.')[0]  # Remove microseconds
         }
 
 class CentroidTracker:
-    def __init__(self, max_disappeared=30, max_distance=100):
+    # Constant-velocity Kalman model over (cx, cy, vx, vy), one step per processed frame
+    KF_F = np.array([[1, 0, 1, 0],
+                     [0, 1, 0, 1],
+                     [0, 0, 1, 0],
+                     [0, 0, 0, 1]], dtype=np.float64)
+    KF_Q = np.eye(4) * 1.0   # Process noise
+    KF_R = np.eye(2) * 10.0  # Measurement noise
+    
+    def __init__(self, max_disappeared=30, max_distance=100, initial_capacity=16):
         self.next_object_id = 0
         self.objects = OrderedDict()
-        self.disappeared = OrderedDict()
+        self.class_counts = Counter()  # Tracked objects per vehicle type
         self.max_disappeared = max_disappeared
         self.max_distance = max_distance
+        
+        # Per-track matching state as columns sharing one row index (rows 0..size-1 are live)
+        self._size = 0
+        self._ids = []   # row -> object id
+        self._rows = {}  # object id -> row
+        self._bboxes = np.zeros((initial_capacity, 4), dtype=np.float32)
+        self._type_ids = np.zeros(initial_capacity, dtype=np.int8)
+        self._disappeared = np.zeros(initial_capacity, dtype=np.int32)  # Consecutive frames unmatched
+        self._kf_state = np.zeros((initial_capacity, 4), dtype=np.float64)
+        self._kf_P = np.zeros((initial_capacity, 4, 4), dtype=np.float64)
+        
+        # Serialized objects for the API, rebuilt only after a mutation or once it goes stale
+        self._dirty = True
+        self._cached_objects = None
+        self._cache_valid_until = 0.0
+    
+    def _grow(self):
+        """Double the capacity of every column"""
+        capacity = len(self._bboxes) * 2
+        for name in ('_bboxes', '_type_ids', '_disappeared', '_kf_state', '_kf_P'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
     
     def register(self, vehicle_type, confidence, bbox, centroid):
         """Register a new object"""
-        obj = DetectedObject(vehicle_type, confidence, bbox, centroid)
+        obj_id = f'{self.next_object_id:08x}'  # Short unique ID
+        self.next_object_id += 1
+        obj = DetectedObject(vehicle_type, confidence, bbox, centroid, obj_id)
+        self._dirty = True
         self.objects[obj.id] = obj
-        self.disappeared[obj.id] = 0
+        self.class_counts[vehicle_type] += 1
+        
+        if self._size == len(self._bboxes):
+            self._grow()
+        row = self._size
+        self._bboxes[row] = bbox
+        self._type_ids[row] = obj.type_id
+        self._disappeared[row] = 0
+        # Kalman track starts at rest on the first centroid
+        self._kf_state[row] = (centroid[0], centroid[1], 0.0, 0.0)
+        self._kf_P[row] = np.eye(4) * 10.0
+        self._ids.append(obj.id)
+        self._rows[obj.id] = row
+        self._size += 1
         return obj
     
     def deregister(self, object_id):
         """Deregister an object"""
+        self._dirty = True
+        self.class_counts[self.objects[object_id].vehicle_type] -= 1
         del self.objects[object_id]
-        del self.disappeared[object_id]
+        
+        # Move the last row into the freed slot
+        row = self._rows.pop(object_id)
+        last = self._size - 1
+        if row != last:
+            for column in (self._bboxes, self._type_ids, self._disappeared, self._kf_state, self._kf_P):
+                column[row] = column[last]
+            moved_id = self._ids[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+        self._ids.pop()
+        self._size -= 1
+    
+    def _bulk_deregister(self, rows):
+        """Deregister the objects at the given rows"""
+        # Highest row first, so the last row swapped into each slot is never one still to be removed
+        for row in sorted(rows.tolist(), reverse=True):
+            object_id = self._ids[row]
+            self.deregister(object_id)
+            logger.info(f"Deregistered {object_id} (disappeared too long)")
+    
+    def _age_unmatched(self, unmatched):
+        """Count one more missed frame for the unmatched rows and drop those gone too long"""
+        disappeared = self._disappeared[:self._size]
+        disappeared[unmatched] += 1
+        expired = disappeared > self.max_disappeared
+        if expired.any():
+            self._bulk_deregister(np.flatnonzero(expired))
+    
+    def cached_payload(self, now_mono):
+        """Return the stored API payload if still valid, else None (the caller rebuilds and stores it)"""
+        if not self._dirty and now_mono < self._cache_valid_until:
+            return self._cached_objects
+        
+        # Clear on a miss so a mutation made during the rebuild marks the new payload stale again
+        self._dirty = False
+        return None
+    
+    def store_payload(self, payload, valid_until):
+        """Store the API payload until the next mutation or valid_until (monotonic), whichever comes first"""
+        self._cached_objects = payload
+        self._cache_valid_until = valid_until
+    
+    def predict(self):
+        """Advance every Kalman track by one frame, moving its box onto the predicted centroid"""
+        n = self._size
+        F = self.KF_F
+        self._kf_state[:n] = self._kf_state[:n] @ F.T
+        self._kf_P[:n] = F @ self._kf_P[:n] @ F.T + self.KF_Q
+        
+        # Shift each box by the predicted displacement so the IoU gate also uses the expected position
+        boxes = self._bboxes[:n]
+        shift = self._kf_state[:n, :2] - (boxes[:, :2] + boxes[:, 2:]) * 0.5
+        boxes[:, :2] += shift
+        boxes[:, 2:] += shift
+    
+    def correct(self, row, centroid):
+        """Correct a Kalman track with an observed centroid (H selects cx, cy)"""
+        P = self._kf_P[row]
+        innovation = np.array([centroid[0], centroid[1]]) - self._kf_state[row, :2]
+        
+        # Invert the 2x2 innovation covariance S = H P H^T + R analytically
+        s00 = P[0, 0] + self.KF_R[0, 0]
+        s01 = P[0, 1] + self.KF_R[0, 1]
+        s10 = P[1, 0] + self.KF_R[1, 0]
+        s11 = P[1, 1] + self.KF_R[1, 1]
+        det = s00 * s11 - s01 * s10
+        S_inv = np.array([[s11, -s01], [-s10, s00]]) / det
+        
+        K = P[:, :2] @ S_inv  # P H^T S^-1
+        self._kf_state[row] += K @ innovation
+        self._kf_P[row] = P - K @ P[:2, :]  # (I - K H) P
     
     def calculate_centroid(self, bbox):
-        """Calculate centroid from bounding box"""
-        x1, y1, x2, y2 = bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2']
-        cx = int((x1 + x2) / 2.0)
-        cy = int((y1 + y2) / 2.0)
+        """Calculate centroid from bounding box (x1, y1, x2, y2)"""
+        cx = int((bbox[0] + bbox[2]) * 0.5)
+        cy = int((bbox[1] + bbox[3]) * 0.5)
         return (cx, cy)
     
-    def calculate_overlap(self, bbox1, bbox2):
-        """Calculate IoU (Intersection over Union) between two bounding boxes"""
-        x1 = max(bbox1['x1'], bbox2['x1'])
-        y1 = max(bbox1['y1'], bbox2['y1'])
-        x2 = min(bbox1['x2'], bbox2['x2'])
-        y2 = min(bbox1['y2'], bbox2['y2'])
-        
-        if x2 <= x1 or y2 <= y1:
-            return 0.0
-        
-        intersection = (x2 - x1) * (y2 - y1)
-        area1 = (bbox1['x2'] - bbox1['x1']) * (bbox1['y2'] - bbox1['y1'])
-        area2 = (bbox2['x2'] - bbox2['x1']) * (bbox2['y2'] - bbox2['y1'])
-        union = area1 + area2 - intersection
-        
-        return intersection / union if union > 0 else 0.0
+    def calculate_overlap_matrix(self, boxes_a, boxes_b):
+        """Calculate the IoU between every box in boxes_a (N, 4) and boxes_b (M, 4) as an (N, M) matrix"""
+        tl = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+        br = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+        wh = np.clip(br - tl, 0, None)
+        intersection = wh[..., 0] * wh[..., 1]
+        area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+        area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+        return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+    
+    def calculate_cost_matrix(self, obj_boxes, obj_centroids, obj_type_ids, det_boxes, det_centroids, det_type_ids):
+        """Calculate the (N, M) assignment cost between objects and detections (lower is better)"""
+        if NUMBA_AVAILABLE:
+            return _build_cost(obj_boxes, obj_centroids, obj_type_ids,
+                               det_boxes, det_centroids, det_type_ids, float(self.max_distance))
+        
+        iou_matrix = self.calculate_overlap_matrix(obj_boxes, det_boxes)
+        distance_matrix = dist.cdist(obj_centroids, det_centroids)
+        type_match = obj_type_ids[:, None] == det_type_ids[None, :]
+        
+        # Good matches combine distance and overlap costs, poor matches get a high cost
+        valid = type_match & (distance_matrix <= self.max_distance) & (iou_matrix >= MIN_MATCH_IOU)
+        distance_cost = distance_matrix / self.max_distance  # Normalize to 0-1
+        overlap_cost = 1 - iou_matrix  # Convert to cost (higher overlap = lower cost)
+        return np.where(valid, (distance_cost * DISTANCE_WEIGHT) + (overlap_cost * OVERLAP_WEIGHT), NO_MATCH_COST)
     
     def update(self, detections):
         """
         Update tracker with new detections using Hungarian Algorithm approach
-        detections: list of tuples (vehicle_type, confidence, bbox)
+        detections: list of tuples (vehicle_type, confidence, bbox) with bbox a float32 array (x1, y1, x2, y2)
         """
+        # Nothing tracked and nothing detected
+        if not detections and not self.objects:
+            return []
+        
+        # Project every track forward (also while unseen) so matching uses its expected position
+        if self.objects:
+            self.predict()
+        
         if len(detections) == 0:
             # Mark all existing objects as disappeared
-            for object_id in list(self.disappeared.keys()):
-                self.disappeared[object_id] += 1
-                if self.disappeared[object_id] > self.max_disappeared:
-                    self.deregister(object_id)
+            self._age_unmatched(slice(None))
             return []
         
         # Initialize detection info
@@ -133,92 +338,48 @@ class CentroidTracker:
                 logger.info(f"First detection: {obj.id} ({vehicle_type})")
             return new_objects
         
-        # Create cost matrix for assignment
-        object_ids = list(self.objects.keys())
-        cost_matrix = []
+        # Create cost matrix for assignment (object index == column row)
+        n = self._size
         
-        for object_id in object_ids:
-            existing_obj = self.objects[object_id]
-            row_costs = []
-            
-            for vehicle_type, confidence, bbox, centroid in detection_info:
-                # Calculate distance cost
-                distance = dist.euclidean(existing_obj.centroid, centroid)
-                
-                # Calculate overlap
-                overlap = self.calculate_overlap(existing_obj.bbox, bbox)
-                
-                # Check vehicle type match
-                type_match = existing_obj.vehicle_type == vehicle_type
-                
-                # Calculate combined cost (lower is better)
-                if type_match and distance <= self.max_distance and overlap >= 0.05:
-                    # Good match - combine distance and overlap costs
-                    distance_cost = distance / self.max_distance  # Normalize to 0-1
-                    overlap_cost = 1 - overlap  # Convert to cost (higher overlap = lower cost)
-                    combined_cost = (distance_cost * 0.6) + (overlap_cost * 0.4)
-                    row_costs.append(combined_cost)
-                else:
-                    # Poor match - assign high cost
-                    row_costs.append(999.0)
-            
-            cost_matrix.append(row_costs)
+        object_boxes = self._bboxes[:n]
+        object_centroids = self._kf_state[:n, :2].astype(np.float32)
+        object_type_ids = self._type_ids[:n]
+        detection_boxes = np.stack([det[2] for det in detection_info])
+        detection_centroids = np.array([det[3] for det in detection_info], dtype=np.float32)
+        detection_type_ids = np.fromiter((DetectedObject.VEHICLE_TYPE_TO_INT[det[0]] for det in detection_info),
+                                         dtype=np.int8, count=len(detection_info))
         
-        # Simple assignment algorithm (greedy approach for multiple objects)
-        assignments = []
-        used_detections = set()
-        used_objects = set()
+        # Predicted objects are matched against detections by distance, IoU and vehicle type
+        cost_array = self.calculate_cost_matrix(object_boxes, object_centroids, object_type_ids,
+                                                detection_boxes, detection_centroids, detection_type_ids)
         
-        # Convert cost matrix to numpy for easier processing
-        if len(cost_matrix) > 0 and len(cost_matrix[0]) > 0:
-            cost_array = np.array(cost_matrix)
-            
-            # Find best assignments iteratively
-            for _ in range(min(len(object_ids), len(detection_info))):
-                # Find minimum cost that hasn't been used
-                min_cost = float('inf')
-                best_obj_idx = -1
-                best_det_idx = -1
-                
-                for obj_idx in range(len(object_ids)):
-                    if obj_idx in used_objects:
-                        continue
-                    for det_idx in range(len(detection_info)):
-                        if det_idx in used_detections:
-                            continue
-                        if cost_array[obj_idx, det_idx] < min_cost:
-                            min_cost = cost_array[obj_idx, det_idx]
-                            best_obj_idx = obj_idx
-                            best_det_idx = det_idx
-                
-                # If we found a valid assignment (cost < 1.0)
-                if best_obj_idx != -1 and best_det_idx != -1 and min_cost < 1.0:
-                    assignments.append((best_obj_idx, best_det_idx))
-                    used_objects.add(best_obj_idx)
-                    used_detections.add(best_det_idx)
-                else:
-                    break  # No more good matches
+        # Optimal assignment (Hungarian algorithm), keeping only good matches
+        row_ind, col_ind = linear_sum_assignment(cost_array)
+        matched = cost_array[row_ind, col_ind] < MAX_MATCH_COST
+        
+        assignments = list(zip(row_ind[matched].tolist(), col_ind[matched].tolist()))
+        used_detections = set(col_ind[matched].tolist())
         
         # Update matched objects
         for obj_idx, det_idx in assignments:
-            object_id = object_ids[obj_idx]
+            object_id = self._ids[obj_idx]
             vehicle_type, confidence, bbox, centroid = detection_info[det_idx]
             
             existing_obj = self.objects[object_id]
+            self._dirty = True
             existing_obj.update_detection(confidence, bbox, centroid)
-            self.disappeared[object_id] = 0
+            self._disappeared[obj_idx] = 0
+            self._bboxes[obj_idx] = detection_boxes[det_idx]
+            self.correct(obj_idx, centroid)
             
-            distance = dist.euclidean(existing_obj.centroid, centroid)
-            overlap = self.calculate_overlap(existing_obj.bbox, bbox)
-            logger.info(f"Updated {object_id} ({vehicle_type}) - Dist: {distance:.1f}, IoU: {overlap:.2f}")
+            distance = np.linalg.norm(object_centroids[obj_idx] - detection_centroids[det_idx])
+            cost = cost_array[obj_idx, det_idx]
+            logger.info(f"Updated {object_id} ({vehicle_type}) - Dist: {distance:.1f}, Cost: {cost:.2f}")
         
         # Mark unmatched existing objects as disappeared
-        for obj_idx, object_id in enumerate(object_ids):
-            if obj_idx not in used_objects:
-                self.disappeared[object_id] += 1
-                if self.disappeared[object_id] > self.max_disappeared:
-                    self.deregister(object_id)
-                    logger.info(f"Deregistered {object_id} (disappeared too long)")
+        unmatched = np.ones(n, dtype=bool)
+        unmatched[row_ind[matched]] = False
+        self._age_unmatched(unmatched)
         
         # Register unmatched detections as new objects
         new_objects = []
@@ -252,31 +413,58 @@ class VehicleDetector:
         # Detection state
         self.is_running = False
         self.model = None
+        self.device = 0 if torch.cuda.is_available() else 'cpu'
+        self.use_half = self.device == 0  # FP16 inference on CUDA only
         self.cap = None
         self.detection_thread = None
         
+        # Latest decoded camera frame, filled by the grabber thread
+        self._frame_slot = deque(maxlen=1)
+        self._grab_thread = None
+        
         # Vehicle classes - hardcoded untuk motor dan mobil saja
         self.vehicle_classes = {
             0: 'car',        # Mobil (semua jenis mobil)
             1: 'motorcycle'  # Motor/sepeda motor
         }
         self.class_names = list(self.vehicle_classes.values())
+        self.vehicle_class_ids = np.array(list(self.vehicle_classes.keys()), dtype=np.int32)
         
         logger.info(f"Initialized with {len(self.class_names)} vehicle classes")
         logger.info(f"Classes: {self.class_names}")
         
         self._load_model()
+        self._warmup_tracker()
     
     def _load_model(self):
         """Load YOLO model with error handling"""
         try:
             self.model = YOLO(self.model_path)
-            logger.info(f"Model loaded successfully: {self.model_path}")
+            self.model.fuse()  # Fold Conv+BN layers once instead of on the first frame
+            
+            if not self.use_half:
+                # CPU inference: NHWC layout and leave one core for the Flask server
+                self.model.model.to(memory_format=torch.channels_last)
+                torch.set_num_threads(max(1, (os.cpu_count() or 1) - 1))
+            
+            logger.info(f"Model loaded successfully: {self.model_path} "
+                        f"(device={self.device}, half={self.use_half})")
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             # Continue without model for testing
             self.model = None
     
+    def _warmup_tracker(self):
+        """Run the tracker cost kernel once so JIT compilation doesn't delay the first frame"""
+        if not NUMBA_AVAILABLE:
+            return
+        
+        boxes = np.array([[0, 0, 10, 10]], dtype=np.float32)
+        centroids = np.array([[5, 5]], dtype=np.float32)
+        type_ids = np.array([0], dtype=np.int8)
+        self.tracker.calculate_cost_matrix(boxes, centroids, type_ids, boxes, centroids, type_ids)
+        logger.info("Tracker cost kernel compiled")
+    
     def _connect_camera(self):
         """Connect to camera with retry mechanism"""
         try:
@@ -292,6 +480,23 @@ class VehicleDetector:
             logger.warning(f"Camera connection failed: {e}")
             return False
     
+    def _grab_loop(self):
+        """Keep reading the camera so the detection loop always gets the newest frame"""
+        cap = self.cap
+        try:
+            while self.is_running:
+                if not cap.grab():
+                    logger.warning("Failed to read frame")
+                    time.sleep(1)
+                    continue
+                
+                ok, frame = cap.retrieve()
+                if ok:
+                    self._frame_slot.append(frame)
+        finally:
+            # Released here so it can never happen while grab() is still blocked on the stream
+            cap.release()
+    
     def detect_vehicles(self):
         """Main detection loop with improved error handling"""
         if not self._connect_camera():
@@ -301,6 +506,7 @@ class VehicleDetector:
             
             simulation_counter = 0
             simulated_objects = []  # Keep track of simulated objects for consistency
+            rng = np.random.default_rng()
             
             while self.is_running:
                 simulation_counter += 1
@@ -308,26 +514,21 @@ class VehicleDetector:
                 
                 # Simulate multiple objects in the same frame
                 if simulation_counter % 3 == 0:  # Every 6 seconds
-                    import random
-                    
                     # Simulate 1-3 objects at once
-                    num_objects = random.randint(1, 3)
+                    num_objects = int(rng.integers(1, 4))
+                    class_idx = rng.integers(0, len(self.class_names), size=num_objects)
+                    confidences = rng.uniform(0.6, 0.95, size=num_objects)
+                    
+                    # Create random but non-overlapping bounding boxes, spread horizontally
+                    base = np.column_stack([100 + np.arange(num_objects) * 150,
+                                            100 + rng.integers(-30, 31, size=num_objects)])
+                    top_left = base + rng.integers(-20, 21, size=(num_objects, 2))
+                    size = np.column_stack([rng.integers(80, 121, size=num_objects),
+                                            rng.integers(60, 101, size=num_objects)])
+                    bboxes = np.hstack([top_left, top_left + size]).astype(np.float32)
                     
                     for i in range(num_objects):
-                        random_class = random.choice(self.class_names)
-                        random_confidence = random.uniform(0.6, 0.95)
-                        
-                        # Create random but non-overlapping bounding boxes
-                        base_x = 100 + (i * 150)  # Spread objects horizontally
-                        base_y = 100 + random.randint(-30, 30)
-                        
-                        x1 = base_x + random.randint(-20, 20)
-                        y1 = base_y + random.randint(-20, 20)
-                        x2 = x1 + random.randint(80, 120)
-                        y2 = y1 + random.randint(60, 100)
-                        
-                        bbox = {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}
-                        detections.append((random_class, random_confidence, bbox))
+                        detections.append((self.class_names[class_idx[i]], float(confidences[i]), bboxes[i]))
                     
                     # Log simulated detections
                     if detections:
@@ -349,19 +550,17 @@ class VehicleDetector:
             return
         
         self.is_running = True
-        frame_skip = 0
+        self._frame_slot.clear()
+        self._grab_thread = threading.Thread(target=self._grab_loop, daemon=True)
+        self._grab_thread.start()
         
         try:
             while self.is_running:
-                ret, frame = self.cap.read()
-                if not ret:
-                    logger.warning("Failed to read frame")
-                    time.sleep(1)
-                    continue
-                
-                # Skip frames to reduce processing load
-                frame_skip += 1
-                if frame_skip % 5 != 0:  # Process every 5th frame
+                # Take the newest frame; older ones were already dropped by the grabber
+                try:
+                    frame = self._frame_slot.pop()
+                except IndexError:
+                    time.sleep(0.01)
                     continue
                 
                 # Process detections from each frame
@@ -369,27 +568,24 @@ class VehicleDetector:
                 
                 if self.model:
                     try:
-                        results = self.model(frame, conf=self.confidence_threshold)
+                        results = self.model(frame, conf=self.confidence_threshold, imgsz=640,
+                                             device=self.device, half=self.use_half, verbose=False)
                         
                         # Process ALL detections in the frame
                         frame_detections = []
                         for result in results:
                             boxes = result.boxes
                             if boxes is not None and len(boxes) > 0:
-                                for box in boxes:
-                                    class_id = int(box.cls[0])
-                                    confidence = float(box.conf[0])
-                                    
-                                    # Check if class_id exists in our vehicle classes
-                                    if class_id in self.vehicle_classes:
-                                        class_name = self.vehicle_classes[class_id]
-                                        
-                                        # Get bounding box coordinates
-                                        if hasattr(box, 'xyxy'):
-                                            x1, y1, x2, y2 = box.xyxy[0].tolist()
-                                            bbox = {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}
-                                            
-                                            frame_detections.append((class_name, confidence, bbox))
+                                # Copy each result tensor to the CPU once instead of per box
+                                class_ids = boxes.cls.cpu().numpy().astype(np.int32)
+                                confidences = boxes.conf.cpu().numpy()
+                                bboxes = boxes.xyxy.cpu().numpy().astype(np.float32)
+                                
+                                # Keep only our vehicle classes
+                                mask = np.isin(class_ids, self.vehicle_class_ids)
+                                for class_id, confidence, bbox in zip(class_ids[mask], confidences[mask], bboxes[mask]):
+                                    class_name = self.vehicle_classes[int(class_id)]
+                                    frame_detections.append((class_name, float(confidence), bbox))
                         
                         # Log all detections found in this frame
                         if frame_detections:
@@ -417,8 +613,11 @@ class VehicleDetector:
         except Exception as e:
             logger.error(f"Detection loop error: {e}")
         finally:
-            if self.cap:
-                self.cap.release()
+            # Stop the grabber; it releases the capture once its current grab() returns
+            self.is_running = False
+            self._grab_thread.join(timeout=2)
+            if self._grab_thread.is_alive():
+                logger.warning("Camera read still blocked, capture will be released when it returns")
             cv2.destroyAllWindows()
     
     def start_detection(self):
@@ -445,23 +644,34 @@ class VehicleDetector:
     
     def get_detected_objects(self):
         """Get list of detected objects with current status"""
+        tracker = self.tracker
+        now_mono = time.monotonic()
+        cached = tracker.cached_payload(now_mono)
+        if cached is not None:
+            return cached
+        
         objects_list = []
         active_count = 0
+        next_expiry = float('inf')
+        now = datetime.now()
         
-        for obj_id, obj in self.tracker.objects.items():
-            obj_dict = obj.to_dict()
+        # Most recently seen first, ordered on the numeric monotonic timestamp
+        for obj in sorted(tracker.objects.values(), key=attrgetter('last_seen_mono'), reverse=True):
+            obj_dict = obj.to_dict(now, now_mono)
             objects_list.append(obj_dict)
             if obj_dict['status'] == 'Active':
                 active_count += 1
+                next_expiry = min(next_expiry, obj.last_seen_mono + 10.0)
         
-        # Sort by most recently seen first
-        objects_list.sort(key=lambda x: x['detected_at'], reverse=True)
-        
-        return {
+        result = {
             'objects': objects_list,
             'total_objects': len(objects_list),
             'active_objects': active_count
         }
+        
+        # Valid until the next Active -> Expired flip, or 1s so 'duration' stays current
+        tracker.store_payload(result, min(next_expiry, now_mono + 1.0))
+        return result
     
     def get_class_info(self):
         """Get information about loaded classes"""
@@ -475,16 +685,12 @@ class VehicleDetector:
         """Get statistics by vehicle class"""
         stats = {'car': {'count': 0, 'percentage': 0}, 'motorcycle': {'count': 0, 'percentage': 0}}
         
-        if self.tracker.objects:
-            for obj in self.tracker.objects.values():
-                if obj.vehicle_type in stats:
-                    stats[obj.vehicle_type]['count'] += 1
-            
-            # Calculate percentages
-            total = len(self.tracker.objects)
-            if total > 0:
-                for vehicle_type in stats:
-                    stats[vehicle_type]['percentage'] = round((stats[vehicle_type]['count'] / total) * 100, 1)
+        total = len(self.tracker.objects)
+        if total > 0:
+            for vehicle_type in stats:
+                count = self.tracker.class_counts[vehicle_type]
+                stats[vehicle_type]['count'] = count
+                stats[vehicle_type]['percentage'] = round((count / total) * 100, 1)
         
         return stats
 
@@ -509,7 +715,7 @@ def vehicle_detection():
 def vehicle_stats():
     """Get detailed statistics"""
     objects_data = detector.get_detected_objects()
-    return jsonify({
+    return ojson({
         'current_count': detector.vehicle_count,
         'hourly_history': list(detector.hourly_counts),
         'is_running': detector.is_running,
@@ -522,7 +728,7 @@ def vehicle_stats():
 @app.route('/detected-objects', methods=['GET'])
 def detected_objects():
     """Get list of detected objects"""
-    return jsonify(detector.get_detected_objects())
+    return ojson(detector.get_detected_objects())
 
 @app.route('/start-detection', methods=['POST'])
 def start_detection():
@@ -562,7 +768,7 @@ def get_classes():
 def health_check():
     """Health check endpoint"""
     objects_data = detector.get_detected_objects()
-    return jsonify({
+    return ojson({
         'status': 'healthy',
         'detection_running': detector.is_running,
         'timestamp': datetime.now().isoformat(),
@@ -581,6 +787,10 @@ if __name__ == '__main__':
             import scipy
         except ImportError:
             print("⚠️  scipy is required for object tracking. Install with: pip install scipy")
+        if not NUMBA_AVAILABLE:
+            print("⚠️  numba not found, tracker uses the NumPy cost matrix. Install with: pip install numba")
+        if not ORJSON_AVAILABLE:
+            print("⚠️  orjson not found, API responses use jsonify. Install with: pip install orjson")
         
         # Start detection automatically
         detector.start_detection()
@@ -595,6 +805,7 @@ if __name__ == '__main__':
         print("📋 Classes: http://localhost:5000/classes")
         print("🔖 Objects: http://localhost:5000/detected-objects")
         print("❤️  Health: http://localhost:5000/health")
+        print("🚀 Production: gunicorn app:app (settings in gunicorn.conf.py)")
         print("=" * 70)
         print(f"📁 Loaded {len(detector.class_names)} classes: {', '.join(detector.class_names)}")
         print("🎯 Class Mapping:")
@@ -605,7 +816,7 @@ if __name__ == '__main__':
         print(f"   Max Disappeared: {detector.tracker.max_disappeared} frames")
         print("=" * 70)
         
-        # Run Flask server
+        # Run Flask development server (use gunicorn for deployments)
         app.run(debug=False, host='0.0.0.0', port=5000, threaded=True)
         
     except KeyboardInterrupt:
@@ -0,0 +1,17 @@
+# Production server: gunicorn app:app (run from this directory)
+#
+# One worker process so every request sees the same detector and tracker state.
+# Threaded workers rather than gevent: gevent would monkey-patch the detection
+# thread into a greenlet, and YOLO inference would then block every request.
+
+bind = '0.0.0.0:5000'
+workers = 1
+worker_class = 'gthread'
+threads = 4
+timeout = 60
+
+
+def post_worker_init(worker):
+    """Start detection inside the worker (the app's __main__ block doesn't run under gunicorn)"""
+    from app import detector
+    detector.start_detection()